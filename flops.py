@@ -0,0 +1,49 @@
+# Closed-form training FLOP formulas. This is the only copy: flops_kernel.pyx includes this file
+# verbatim and operations_numba.py JIT-compiles these functions.
+
+def layer_flops(b: int, s: int, h: int, n_h: int, n_kv: int, d_ff: int, flash_attn: bool = False):
+    # Closed form of the per-layer ops built by Model.build_ops, summed symbolically.
+    # Returns (fwd, bwd, linear) FLOPs for a single layer, where linear is fwd + bwd of the Linear ops only.
+    d = h // n_h
+    n_rep = n_h // n_kv
+    bsh = b * s * h
+    bsff = b * s * d_ff
+    bnhss = b * n_h * s * s
+    bsnhd = b * s * n_h * d
+    bsnkvd = b * s * n_kv * d
+
+    # qkv (same FLOPs fused or split) + out projections + three FFN projections
+    linear_fwd = 2 * bsh * (2 * h + 2 * n_kv * d + 3 * d_ff)
+
+    if flash_attn:
+        # Scale + softmax fused away; backward recomputes attn_scores + softmax
+        attn_fwd = 4 * bnhss * d
+        attn_bwd = 10 * bnhss * d + 5 * bnhss
+    else:
+        attn_fwd = 4 * bnhss * d + 6 * bnhss  # attn_scores + attn_v, scale + softmax
+        attn_bwd = 8 * bnhss * d + 5 * bnhss
+
+    fwd = (
+        linear_fwd
+        + 8 * bsh  # two RMSNorms
+        + 3 * (bsnhd + bsnkvd)  # q/k rotary
+        + attn_fwd
+        + 2 * bsh  # two residual adds
+        + 6 * bsff  # elementwise gate + SiLU
+    )
+    bwd = (
+        2 * linear_fwd
+        + 18 * bsh
+        + 3 * (bsnhd + bsnkvd)
+        + 2 * bsnkvd * (n_rep - 1)  # k/v repeat reductions
+        + attn_bwd
+        + 11 * bsff
+    )
+    return fwd, bwd, 3 * linear_fwd
+
+def head_flops(b: int, s: int, h: int, V: int):
+    # Closed form of the non-layer ops (embedding, final norm, LM head).
+    # Returns (fwd, bwd, linear) FLOPs.
+    bsh = b * s * h
+    linear_fwd = 2 * bsh * V
+    return linear_fwd + 4 * bsh, 2 * linear_fwd + 9 * bsh, 3 * linear_fwd
@@ -0,0 +1,5 @@
+# cython: language_level=3
+# Compiled build of the closed-form FLOP formulas in flops.py, which is included verbatim so there is
+# a single copy of the arithmetic. Build in place with: cythonize -i flops_kernel.pyx
+# The formulas are untyped, so Cython keeps Python int semantics: results stay exact at any shape.
+include "flops.py"
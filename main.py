@@ -29,32 +29,23 @@ def main():
         }
     }
 
-    all_phases_fwd = 0.0
-    all_phases_bwd = 0.0
-    all_phases_total = 0.0
-    all_phases_linear = 0.0
+    # Stack the phases column-wise and compute them all in one batched call
+    bs = [phase["b"] for phase in phases.values()]
+    ss = [phase["s"] for phase in phases.values()]
+    rs = [phase["rounds"] for phase in phases.values()]
+    phase_flops = model.get_training_flops_batch(bs, ss, rs)
 
-    for phase_name, phase in phases.items():
+    for phase_name, flops_dict in zip(phases, phase_flops):
         print(f"\nPhase: {phase_name}")
-
-        b = phase["b"]
-        s = phase["s"]
-        rounds = phase["rounds"]
-
-        # Re-compile the operations for the new (b, s)
-        model.compile(b, s)
-
-        # Compute FLOPs
-        flops_dict = model.get_training_flops(rounds=rounds)
         print(f"Forward FLOPs:  {flops_dict['fwd_flops']}")
         print(f"Backward FLOPs: {flops_dict['bwd_flops']}")
         print(f"Total FLOPs:    {flops_dict['total_flops']}")
 
-        # Accumulate totals
-        all_phases_fwd += flops_dict["fwd_flops"]
-        all_phases_bwd += flops_dict["bwd_flops"]
-        all_phases_total += flops_dict["total_flops"]
-        all_phases_linear += flops_dict["total_linear_flops"]
+    # Accumulate totals
+    all_phases_fwd = sum(flops_dict["fwd_flops"] for flops_dict in phase_flops)
+    all_phases_bwd = sum(flops_dict["bwd_flops"] for flops_dict in phase_flops)
+    all_phases_total = all_phases_fwd + all_phases_bwd
+    all_phases_linear = sum(flops_dict["total_linear_flops"] for flops_dict in phase_flops)
 
     print("\nTotal across all phases")
     print(f"Forward FLOPs:       {all_phases_fwd}")
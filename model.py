@@ -1,86 +1,205 @@
+from functools import lru_cache
+
 from operations import *
 
+# Prefer compiled FLOP formulas: the Cython extension if it has been built, else numba if installed,
+# else the pure-Python formulas
+try:
+    from flops_kernel import head_flops, layer_flops
+except ImportError:
+    try:
+        from operations_numba import head_flops, layer_flops
+    except ImportError:
+        from flops import head_flops, layer_flops
+
+@lru_cache(maxsize=None)
+def _flops(b: int, s: int, h: int, V: int, L: int, n_h: int, n_kv: int, d_ff: int, flash_attn: bool = False):
+    # Per-round (fwd, bwd, linear) training FLOPs, memoised on the shape tuple
+    layer_fwd, layer_bwd, layer_linear = layer_flops(b, s, h, n_h, n_kv, d_ff, flash_attn)
+    head_fwd, head_bwd, head_linear = head_flops(b, s, h, V)
+    return L * layer_fwd + head_fwd, L * layer_bwd + head_bwd, L * layer_linear + head_linear
+
+def _flops_dict(per_round: tuple[int, int, int], rounds: int):
+    # Scale per-round FLOPs by rounds; the total is derived from the scaled fwd/bwd rather than multiplied again
+    fwd, bwd, linear = per_round
+    fwd *= rounds
+    bwd *= rounds
+    return {
+        "fwd_flops": fwd,
+        "bwd_flops": bwd,
+        "total_flops": fwd + bwd,
+        "total_linear_flops": linear * rounds
+    }
+
 class Model:
-    def __init__(self, h: int, V: int, L: int, n_h: int, n_kv: int, d_ff: int):
+    def __init__(self, h: int, V: int, L: int, n_h: int, n_kv: int, d_ff: int, fuse_qkv: bool = True, flash_attn: bool = False):
         self.h = h # model dimension
         self.V = V # vocab size
         self.L = L # number of layers
         self.n_h = n_h # total # of attention heads
         self.n_kv = n_kv # number of key-value heads (<= n_h)
         self.d_ff = d_ff # feed-forward hidden dimension
-        self.ops = []
+        # Both flags shape the op template built below, so they are fixed after construction
+        self._fuse_qkv = fuse_qkv # model q/k/v projections as a single fused matmul
+        self._flash_attn = flash_attn # account attention as a FlashAttention kernel
+
+        # Head dim and GQA repeat factor use integer division, so they must divide evenly
+        if n_h <= 0 or h % n_h != 0:
+            raise ValueError(f"h ({h}) must be divisible by n_h ({n_h})")
+        if n_kv <= 0 or n_h % n_kv != 0:
+            raise ValueError(f"n_h ({n_h}) must be divisible by n_kv ({n_kv})")
+        self.b = None
+        self.s = None
+
+        # Op structure is fixed for the model; only (b, s) change between compiles
+        self.op_template, self.layer_slice = self.build_op_template()
+        n_ops = len(self.op_template)
+        # Op table stored column-wise; names are only used for per-op breakdowns
+        self.op_names = [name for name, _, _, _ in self.op_template]
+        self.fwd_flops = [0] * n_ops
+        self.bwd_flops = [0] * n_ops
+        self.op_kinds = [op_cls.kind for _, op_cls, _, _ in self.op_template]
+        # Times each op runs per step: L for the per-layer slice, once otherwise
+        self.op_repeats = [1] * n_ops
+        self.op_repeats[self.layer_slice] = [L] * (self.layer_slice.stop - self.layer_slice.start)
+        self.ops_shape = None # (b, s) the op table was last filled for
+
+    @property
+    def fuse_qkv(self) -> bool:
+        return self._fuse_qkv
+
+    @property
+    def flash_attn(self) -> bool:
+        return self._flash_attn
+
+    def build_op_template(self):
+        """Build the (name, op class, args_fn, numel_key) entries evaluated per (b, s) by build_ops, and the per-layer slice."""
+        h, V, n_h, n_kv, d_ff = self.h, self.V, self.n_h, self.n_kv, self.d_ff
+        d = h // n_h  # head dimension
+        n_rep = n_h // n_kv
+
+        # Attention module
+        layer_ops = [("pre_attn_rmsnorm", RMSNorm, lambda b, s: ((b, s, h),), "bsh")]
+
+        if self.fuse_qkv:
+            # Single [h, h + 2 * n_kv * d] projection, as in fused wqkv kernels
+            layer_ops.append(("qkv_proj", Linear, lambda b, s: ((b, s, h), h + 2 * n_kv * d), "bsh"))
+        else:
+            layer_ops += [
+                ("q_proj", Linear, lambda b, s: ((b, s, h), h), "bsh"),
+                ("k_proj", Linear, lambda b, s: ((b, s, h), n_kv * d), "bsh"),
+                ("v_proj", Linear, lambda b, s: ((b, s, h), n_kv * d), "bsh"),
+            ]
+
+        layer_ops += [
+            ("q_rotary", RotaryEmb, lambda b, s: ((b, s, n_h, d),), "bsnhd"),
+            ("k_rotary", RotaryEmb, lambda b, s: ((b, s, n_kv, d),), "bsnkvd"),
+
+            ("k_repeat_kv", RepeatKV, lambda b, s: ((b, s, n_kv, d), n_rep), "bsnkvd"),
+            ("v_repeat_kv", RepeatKV, lambda b, s: ((b, s, n_kv, d), n_rep), "bsnkvd"),
+
+            ("attn_scores", Matmul, lambda b, s: ((b, n_h, s, d), (b, n_h, d, s)), "bsnhd"),
+        ]
+
+        if self.flash_attn:
+            # Scale + softmax run inside the kernel; their backward recompute is charged to attn_v
+            layer_ops.append(("attn_v", FlashAttnMatmul, lambda b, s: ((b, n_h, s, s), (b, n_h, s, d)), "bnhss"))
+        else:
+            layer_ops += [
+                ("attn_scale", Scale, lambda b, s: ((b, n_h, s, s),), "bnhss"),
+                ("softmax", Softmax, lambda b, s: ((b, n_h, s, s),), "bnhss"),
+                ("attn_v", Matmul, lambda b, s: ((b, n_h, s, s), (b, n_h, s, d)), "bnhss"),
+            ]
+
+        layer_ops += [
+            ("out_proj", Linear, lambda b, s: ((b, s, h), h), "bsh"),
+            ("post_attn_residual", Residual, lambda b, s: ((b, s, h),), "bsh"),
+
+            # FFN module
+            ("pre_ffn_rmsnorm", RMSNorm, lambda b, s: ((b, s, h),), "bsh"),
+            ("ffn_up1", Linear, lambda b, s: ((b, s, h), d_ff), "bsh"),
+            ("ffn_up2", Linear, lambda b, s: ((b, s, d_ff), h), "bsff"),
+            ("ffn_elemtwise", Elementwise, lambda b, s: ((b, s, d_ff),), "bsff"),
+            ("ffn_act", Silu, lambda b, s: ((b, s, d_ff),), "bsff"),
+            ("ffn_down", Linear, lambda b, s: ((b, s, d_ff), h), "bsff"),
+            ("post_ffn_residual", Residual, lambda b, s: ((b, s, h),), "bsh"),
+        ]
+
+        # Per-layer ops occupy this slice of the op table and hold single-layer FLOPs
+        layer_slice = slice(1, 1 + len(layer_ops))
+
+        template = (
+            [("embedding", Embedding, lambda b, s: (), None)]
+            + [(f"all_layers_{name}", op_cls, args_fn, numel_key) for name, op_cls, args_fn, numel_key in layer_ops]
+            + [
+                # Final norm + LM head
+                ("final_norm", RMSNorm, lambda b, s: ((b, s, h),), "bsh"),
+                ("lm_head", Linear, lambda b, s: ((b, s, h), V), "bsh"),
+            ]
+        )
+        return template, layer_slice
 
     def clear_ops(self):
-        """Clear all operations from the model."""
-        self.ops = []
+        """Mark the op table as stale so it is refilled on next use."""
+        self.ops_shape = None
 
     def compile(self, b: int, s: int):
-        d = self.h / self.n_h  # head dimension
-
-        # Clear existing operations
-        self.clear_ops()
-
-        # Embedding
-        self.ops.append(("embedding", Embedding()))
-
-        # Build per-layer operations
-        layer_ops = []
-
-        # Attention module
-        layer_ops.append(("pre_attn_rmsnorm", RMSNorm((b, s, self.h))))
-
-        layer_ops.append(("q_proj", Linear((b, s, self.h), self.h)))
-        layer_ops.append(("k_proj", Linear((b, s, self.h), int(self.n_kv * d))))
-        layer_ops.append(("v_proj", Linear((b, s, self.h), int(self.n_kv * d))))
-
-        layer_ops.append(("q_rotary", RotaryEmb((b, s, self.n_h, d))))
-        layer_ops.append(("k_rotary", RotaryEmb((b, s, self.n_kv, d))))
-
-        n_rep = self.n_h / self.n_kv
-        layer_ops.append(("k_repeat_kv", RepeatKV((b, s, self.n_kv, d), n_rep)))
-        layer_ops.append(("v_repeat_kv", RepeatKV((b, s, self.n_kv, d), n_rep)))
-
-        layer_ops.append(("attn_scores", Matmul((b, self.n_h, s, d), (b, self.n_h, d, s))))
-        layer_ops.append(("attn_scale", Scale((b, self.n_h, s, s))))
-        layer_ops.append(("softmax", Softmax((b, self.n_h, s, s))))
-        layer_ops.append(("attn_v", Matmul((b, self.n_h, s, s), (b, self.n_h, s, d))))
-
-        layer_ops.append(("out_proj", Linear((b, s, self.h), self.h)))
-        layer_ops.append(("post_attn_residual", Residual((b, s, self.h))))
-
-        # FFN module
-        layer_ops.append(("pre_ffn_rmsnorm", RMSNorm((b, s, self.h))))
-        layer_ops.append(("ffn_up1", Linear((b, s, self.h), self.d_ff)))
-        layer_ops.append(("ffn_up2", Linear((b, s, self.d_ff), self.h)))
-        layer_ops.append(("ffn_elemtwise", Elementwise((b, s, self.d_ff))))
-        layer_ops.append(("ffn_act", Silu((b, s, self.d_ff))))
-        layer_ops.append(("ffn_down", Linear((b, s, self.d_ff), self.h)))
-        layer_ops.append(("post_ffn_residual", Residual((b, s, self.h))))
-
-        # Scale per-layer ops by L
-        for name, op in layer_ops:
-            op.fwd_flops *= self.L
-            op.bwd_flops *= self.L
-            self.ops.append((f"all_layers_{name}", op))
-
-        # Final norm + LM head
-        self.ops.append(("final_norm", RMSNorm((b, s, self.h))))
-        self.ops.append(("lm_head", Linear((b, s, self.h), self.V)))
-
-    def get_training_flops(self, rounds: int = 1):
-        fwd_total = sum(op.fwd_flops for _, op in self.ops)
-        bwd_total = sum(op.bwd_flops for _, op in self.ops)
-        total_flops = fwd_total + bwd_total
-
-        # We can also extract linear-only FLOPs:
-        linear_total = sum(
-            (op.fwd_flops + op.bwd_flops) for _, op in self.ops if isinstance(op, Linear)
-        )
+        """Set the batch size and sequence length; the op table is refilled on demand."""
+        self.b = b
+        self.s = s
+
+    def build_ops(self):
+        """Fill the op table in place for the compiled (b, s). Only needed for per-op breakdowns."""
+        b, s = self.b, self.s
+        d = self.h // self.n_h  # head dimension
+
+        # Element counts shared by many ops, hoisted out of the per-op prod()
+        counts = {
+            "bsh": b * s * self.h,
+            "bsff": b * s * self.d_ff,
+            "bnhss": b * self.n_h * s * s,
+            "bsnhd": b * s * self.n_h * d,
+            "bsnkvd": b * s * self.n_kv * d,
+        }
+
+        for i, (_, op_cls, args_fn, numel_key) in enumerate(self.op_template):
+            if numel_key is None:
+                op = op_cls(*args_fn(b, s))
+            else:
+                op = op_cls(*args_fn(b, s), numel=counts[numel_key])
+
+            self.fwd_flops[i] = op.fwd_flops
+            self.bwd_flops[i] = op.bwd_flops
+
+        self.ops_shape = (b, s)
+
+    def get_training_flops_batch(self, bs: list[int], ss: list[int], rounds: list[int]):
+        """Training FLOPs for many (b, s, rounds) phases in one pass, without compiling per phase."""
+        shape = (self.h, self.V, self.L, self.n_h, self.n_kv, self.d_ff, self.flash_attn)
+        return [
+            _flops_dict(_flops(b, s, *shape), r)
+            for b, s, r in zip(bs, ss, rounds, strict=True)
+        ]
+
+    def get_training_flops(self, rounds: int = 1, verbose: bool = False):
+        if self.b is None:
+            raise RuntimeError("call compile(b, s) first")
+
+        # Closed-form totals; no per-op objects are needed
+        per_round = _flops(self.b, self.s, self.h, self.V, self.L, self.n_h, self.n_kv, self.d_ff, self.flash_attn)
 
         # Multiply by rounds
-        return {
-            "fwd_flops": fwd_total * rounds,
-            "bwd_flops": bwd_total * rounds,
-            "total_flops": total_flops * rounds,
-            "total_linear_flops": linear_total * rounds
-        } 
\ No newline at end of file
+        flops_dict = _flops_dict(per_round, rounds)
+
+        # Per-op breakdown for debugging; per-layer ops are scaled by L here, together with rounds
+        if verbose:
+            if self.ops_shape != (self.b, self.s):
+                self.build_ops()
+            flops_dict["ops"] = {
+                name: {"kind": kind, "fwd_flops": fwd * rep * rounds, "bwd_flops": bwd * rep * rounds}
+                for name, kind, fwd, bwd, rep in zip(
+                    self.op_names, self.op_kinds, self.fwd_flops, self.bwd_flops, self.op_repeats
+                )
+            }
+
+        return flops_dict
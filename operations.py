@@ -1,38 +1,61 @@
+from enum import IntEnum
 from math import prod
 
+class OpKind(IntEnum):
+    EMBEDDING = 0
+    LINEAR = 1
+    RMSNORM = 2
+    SOFTMAX = 3
+    MATMUL = 4
+    SILU = 5
+    RESIDUAL = 6
+    SCALE = 7
+    ROTARY_EMB = 8
+    REPEAT_KV = 9
+    ELEMENTWISE = 10
+
 class Operation:
+    kind: OpKind
+
     def __init__(self):
-        self.fwd_flops = 0.0
-        self.bwd_flops = 0.0
-        
-    @property
-    def total_flops(self):
-        return self.fwd_flops + self.bwd_flops
+        self.fwd_flops = 0
+        self.bwd_flops = 0
+        self.total_flops = 0
 
 class Linear(Operation):
-    def __init__(self, input: tuple[int, ...], out_dim: int):
+    kind = OpKind.LINEAR
+
+    def __init__(self, input: tuple[int, ...], out_dim: int, numel: int | None = None):
         super().__init__()
+        n = numel if numel is not None else prod(input)
         # Input: [b, s, h]
         # Params: [h, out_dim]
         # Output: [b, s, out_dim]
-        self.fwd_flops = 2.0 * prod(input) * out_dim
-        self.bwd_flops = 2.0 * self.fwd_flops
+        self.fwd_flops = 2 * n * out_dim
+        self.bwd_flops = 2 * self.fwd_flops
+        self.total_flops = self.fwd_flops + self.bwd_flops
 
 class Embedding(Operation):
+    kind = OpKind.EMBEDDING
+
     def __init__(self):
         super().__init__()
         # We often approximate as 0 or negligible
-        self.fwd_flops = 0.0
-        self.bwd_flops = 0.0
+        self.fwd_flops = 0
+        self.bwd_flops = 0
+        self.total_flops = self.fwd_flops + self.bwd_flops
 
 class RMSNorm(Operation):
-    def __init__(self, input: tuple[int, ...]):
+    kind = OpKind.RMSNORM
+
+    def __init__(self, input: tuple[int, ...], numel: int | None = None):
         # Assuming normalised shape is input[-1]
         super().__init__()
+        n = numel if numel is not None else prod(input)
         # Input: [b, s, h]
         # Params: [h]
         # Output: [b, s, h]
-        self.fwd_flops = 4.0 * prod(input)
+        self.fwd_flops = 4 * n
         # PyTorch autograd breaks this down into several ops:
         # MulBackward0 
         # Incoming grad [b,s,h]; grad for broadcasted gain [b,s,h] = [b,s,h] * [b,s,h] elementwise, grad for gain [h,] = reduce across b,s; grad for fraction [b,s,h] = [b,s,h] * [b,s,h] elementwise => 3bsh flops
@@ -53,67 +76,110 @@ class RMSNorm(Operation):
         # PowBackward0
         # Incoming grad [b,s,h]; grad for input tensor [b,s,h] = raise input tensor [b,s,h] to power of 1, then multiply coefficient, then multiply incoming grad => 2bsh flops
         # Total ~9bsh flops per RMSNorm backward
-        self.bwd_flops = 9.0 * prod(input)
+        self.bwd_flops = 9 * n
+        self.total_flops = self.fwd_flops + self.bwd_flops
 
 class Softmax(Operation):
-    def __init__(self, input: tuple[int, ...]):
+    kind = OpKind.SOFTMAX
+
+    def __init__(self, input: tuple[int, ...], numel: int | None = None):
         super().__init__()
+        n = numel if numel is not None else prod(input)
         # Input Scores: [b, n_h, s, s]
         # Output: [b, n_h, s, s]
-        self.fwd_flops = 5.0 * prod(input)
-        self.bwd_flops = 4.0 * prod(input)
+        self.fwd_flops = 5 * n
+        self.bwd_flops = 4 * n
+        self.total_flops = self.fwd_flops + self.bwd_flops
 
 class Matmul(Operation):
-    def __init__(self, input1: tuple[int, ...], input2: tuple[int, ...]):
+    kind = OpKind.MATMUL
+
+    def __init__(self, input1: tuple[int, ...], input2: tuple[int, ...], numel: int | None = None):
         super().__init__()
+        n = numel if numel is not None else prod(input1)
         # For matrix multiplication of shapes [b, n_h, m, k] @ [b, n_h, k, n] - in the case of attention scores m=s, k=d, n=s; in the case of attention values m=s, k=s, n=d
-        self.fwd_flops = 2.0 * prod(input1) * input2[-1]
-        self.bwd_flops = 2.0 * self.fwd_flops
+        self.fwd_flops = 2 * n * input2[-1]
+        self.bwd_flops = 2 * self.fwd_flops
+        self.total_flops = self.fwd_flops + self.bwd_flops
+
+class FlashAttnMatmul(Matmul):
+    def __init__(self, input1: tuple[int, ...], input2: tuple[int, ...], numel: int | None = None):
+        super().__init__(input1, input2, numel=numel)
+        n = numel if numel is not None else prod(input1)
+        # Attention values matmul [b, n_h, s, s] @ [b, n_h, s, d] inside a FlashAttention kernel
+        # Scale and softmax are fused into the kernel, so the [b, n_h, s, s] scores are never materialised
+        # Backward recomputes the scores (2 * b*n_h*s*s * d, same as this matmul's fwd) and softmax (5 * b*n_h*s*s) block-wise
+        self.bwd_flops += self.fwd_flops + 5 * n
+        self.total_flops = self.fwd_flops + self.bwd_flops
 
 class Silu(Operation):
-    def __init__(self, input: tuple[int, ...]):
+    kind = OpKind.SILU
+
+    def __init__(self, input: tuple[int, ...], numel: int | None = None):
         super().__init__()
+        n = numel if numel is not None else prod(input)
         # Input: [b, s, dim]
-        self.fwd_flops = 5.0 * prod(input)
+        self.fwd_flops = 5 * n
         # ~4 flops for sigmoid + 5 flops for grad_output * sigmoid * (1 + self * (1 - sigmoid))
-        self.bwd_flops = 9.0 * prod(input)
+        self.bwd_flops = 9 * n
+        self.total_flops = self.fwd_flops + self.bwd_flops
 
 class Residual(Operation):
-    def __init__(self, input: tuple[int, ...]):
+    kind = OpKind.RESIDUAL
+
+    def __init__(self, input: tuple[int, ...], numel: int | None = None):
         super().__init__()
+        n = numel if numel is not None else prod(input)
         # Two residual adds per layer
         # Input: [b, s, h], [b, s, h]
-        self.fwd_flops = prod(input)
+        self.fwd_flops = n
         # No flops, just distribute upstream grad through assignment
-        self.bwd_flops = 0.0
+        self.bwd_flops = 0
+        self.total_flops = self.fwd_flops + self.bwd_flops
 
 class Scale(Operation):
-    def __init__(self, input: tuple[int, ...]):
+    kind = OpKind.SCALE
+
+    def __init__(self, input: tuple[int, ...], numel: int | None = None):
         super().__init__()
+        n = numel if numel is not None else prod(input)
         # Input Scores: [b, n_h, s, s]
-        self.fwd_flops = prod(input)
+        self.fwd_flops = n
         self.bwd_flops = self.fwd_flops
+        self.total_flops = self.fwd_flops + self.bwd_flops
 
 class RotaryEmb(Operation):
-    def __init__(self, input: tuple[int, ...]):
+    kind = OpKind.ROTARY_EMB
+
+    def __init__(self, input: tuple[int, ...], numel: int | None = None):
         super().__init__()
+        n = numel if numel is not None else prod(input)
         # Input Q: [b, s, n_h, d/2] or K: [b, s, n_kv, d/2]
         # Elementwise multiply: 6 flops per element (4 muls + 2 adds)
-        self.fwd_flops = 3.0 * prod(input)
+        self.fwd_flops = 3 * n
         #Elementwise multiply for x_q grad or x_k grad
         self.bwd_flops = self.fwd_flops
+        self.total_flops = self.fwd_flops + self.bwd_flops
 
 class RepeatKV(Operation):
-    def __init__(self, input: tuple[int, ...], n_rep: int):
+    kind = OpKind.REPEAT_KV
+
+    def __init__(self, input: tuple[int, ...], n_rep: int, numel: int | None = None):
         super().__init__()
+        n = numel if numel is not None else prod(input)
         # Input xk or xv: [b, s, n_kv, d] each
         # Summation across repeated dimension
-        self.fwd_flops = 0.0  # Negligible in forward pass
-        self.bwd_flops = prod(input) * (n_rep - 1)
+        self.fwd_flops = 0  # Negligible in forward pass
+        self.bwd_flops = n * (n_rep - 1)
+        self.total_flops = self.fwd_flops + self.bwd_flops
 
 class Elementwise(Operation):
-    def __init__(self, input: tuple[int, ...]):
+    kind = OpKind.ELEMENTWISE
+
+    def __init__(self, input: tuple[int, ...], numel: int | None = None):
         super().__init__()
+        n = numel if numel is not None else prod(input)
         # Input: [b, s, d_eff], [b, s, d_eff]
-        self.fwd_flops = prod(input)
-        self.bwd_flops = 2*prod(input) 
\ No newline at end of file
+        self.fwd_flops = n
+        self.bwd_flops = 2 * n
+        self.total_flops = self.fwd_flops + self.bwd_flops
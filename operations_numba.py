@@ -0,0 +1,36 @@
+from numba import njit
+
+from flops import head_flops as _py_head_flops, layer_flops as _py_layer_flops
+
+# JIT-compiled versions of the closed-form FLOP formulas in flops.py.
+# Arithmetic is int64 and wraps silently, so each call first checks a conservative upper bound
+# on every value the formula computes and stays in exact Python ints when it could overflow.
+# The L and rounds multiplies are always left to the caller in Python ints.
+_layer_flops_jit = njit(cache=True)(_py_layer_flops)
+_head_flops_jit = njit(cache=True)(_py_head_flops)
+
+# Headroom below 2**63 so float rounding in the bounds can't hide an overflow
+INT64_LIMIT = 2**62
+
+def _layer_flops_bound(b: int, s: int, h: int, n_h: int, d_ff: int):
+    # Upper bound on every intermediate and output of layer_flops, in float so it can't overflow itself.
+    # With m = max(h, d_ff): linear 3 * linear_fwd <= 42*bs*m^2, elementwise terms <= 37*bs*m,
+    # attention <= 10*b*s^2*h + 6*b*n_h*s^2 (n_h * d <= h).
+    bs = float(b) * s
+    m = float(max(h, d_ff))
+    return 42 * bs * m * m + 37 * bs * m + 10 * bs * s * h + 6 * bs * s * n_h
+
+def _head_flops_bound(b: int, s: int, h: int, V: int):
+    # Upper bound on every intermediate and output of head_flops (linear = 6*bsh*V is the largest).
+    bsh = float(b) * s * h
+    return 6 * bsh * V + 9 * bsh
+
+def layer_flops(b: int, s: int, h: int, n_h: int, n_kv: int, d_ff: int, flash_attn: bool = False):
+    if _layer_flops_bound(b, s, h, n_h, d_ff) < INT64_LIMIT:
+        return _layer_flops_jit(b, s, h, n_h, n_kv, d_ff, flash_attn)
+    return _py_layer_flops(b, s, h, n_h, n_kv, d_ff, flash_attn)
+
+def head_flops(b: int, s: int, h: int, V: int):
+    if _head_flops_bound(b, s, h, V) < INT64_LIMIT:
+        return _head_flops_jit(b, s, h, V)
+    return _py_head_flops(b, s, h, V)
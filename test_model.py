@@ -0,0 +1,87 @@
+import pytest
+
+from model import Model
+from operations import OpKind
+
+CONFIGS = [
+    # main.py config
+    (16384, 126000, 126, 128, 8, 53248),
+    # small shape with grouped-query attention (n_kv < n_h)
+    (64, 100, 3, 8, 2, 96),
+]
+
+@pytest.mark.parametrize("config", CONFIGS)
+@pytest.mark.parametrize("fuse_qkv", [True, False])
+@pytest.mark.parametrize("flash_attn", [True, False])
+def test_op_breakdown_matches_closed_form(config, fuse_qkv, flash_attn):
+    model = Model(*config, fuse_qkv=fuse_qkv, flash_attn=flash_attn)
+    model.compile(3, 7)
+    flops_dict = model.get_training_flops(rounds=2, verbose=True)
+    ops = flops_dict["ops"].values()
+
+    assert sum(op["fwd_flops"] for op in ops) == flops_dict["fwd_flops"]
+    assert sum(op["bwd_flops"] for op in ops) == flops_dict["bwd_flops"]
+    assert sum(
+        op["fwd_flops"] + op["bwd_flops"] for op in ops if op["kind"] == OpKind.LINEAR
+    ) == flops_dict["total_linear_flops"]
+
+@pytest.mark.parametrize("config", CONFIGS)
+def test_batch_matches_per_phase(config):
+    bs, ss, rs = [1000, 1000, 2000], [4096, 8192, 8192], [62, 350311, 776978]
+    model = Model(*config)
+    batch = model.get_training_flops_batch(bs, ss, rs)
+
+    for b, s, rounds, flops_dict in zip(bs, ss, rs, batch, strict=True):
+        model.compile(b, s)
+        assert flops_dict == model.get_training_flops(rounds=rounds)
+
+def test_batch_rejects_mismatched_lengths():
+    with pytest.raises(ValueError):
+        Model(*CONFIGS[1]).get_training_flops_batch([1, 2, 3], [4, 5], [1, 1, 1])
+
+def test_flags_are_read_only():
+    model = Model(*CONFIGS[1])
+    with pytest.raises(AttributeError):
+        model.flash_attn = True
+    with pytest.raises(AttributeError):
+        model.fuse_qkv = False
+
+@pytest.mark.parametrize("h, n_h, n_kv", [
+    (100, 8, 2),  # h % n_h != 0
+    (64, 8, 3),  # n_h % n_kv != 0
+    (64, 8, 0),  # n_kv == 0
+    (64, 0, 2),  # n_h == 0
+])
+def test_rejects_uneven_head_split(h, n_h, n_kv):
+    with pytest.raises(ValueError):
+        Model(h, 100, 3, n_h, n_kv, 96)
+
+def test_get_training_flops_requires_compile():
+    with pytest.raises(RuntimeError):
+        Model(*CONFIGS[1]).get_training_flops()
+
+@pytest.mark.parametrize("b, s", [(2000, 8192), (4000, 131072)])
+@pytest.mark.parametrize("flash_attn", [True, False])
+def test_numba_kernels_match_python(b, s, flash_attn):
+    operations_numba = pytest.importorskip("operations_numba")
+    import flops
+
+    h, V, _, n_h, n_kv, d_ff = CONFIGS[0]
+    assert operations_numba.layer_flops(b, s, h, n_h, n_kv, d_ff, flash_attn) == flops.layer_flops(
+        b, s, h, n_h, n_kv, d_ff, flash_attn
+    )
+    assert operations_numba.head_flops(b, s, h, V) == flops.head_flops(b, s, h, V)
+
+@pytest.mark.parametrize("config", CONFIGS)
+@pytest.mark.parametrize("b, s", [(1, 1), (3, 7), (2000, 8192), (4000, 131072)])
+@pytest.mark.parametrize("flash_attn", [True, False])
+def test_cython_kernel_matches_python(config, b, s, flash_attn):
+    # model.py prefers a built flops_kernel, so a stale build must not drift from flops.py
+    flops_kernel = pytest.importorskip("flops_kernel")
+    import flops
+
+    h, V, _, n_h, n_kv, d_ff = config
+    assert flops_kernel.layer_flops(b, s, h, n_h, n_kv, d_ff, flash_attn) == flops.layer_flops(
+        b, s, h, n_h, n_kv, d_ff, flash_attn
+    )
+    assert flops_kernel.head_flops(b, s, h, V) == flops.head_flops(b, s, h, V)